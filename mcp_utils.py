@@ -1,20 +1,308 @@
 from decimal import Decimal
 import os
+import functools
+import hashlib
+import hmac
 import tempfile
+import time
 import uuid
 import duckdb
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
 from datetime import date, datetime
-import json
+import orjson
 from inmydata.StructuredData import StructuredDataDriver, AIDataFilter, LogicalOperator, ConditionOperator, TopNOption
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator, AsyncIterator, Union, Literal, Annotated
+from typing_extensions import TypedDict, Required
+from pydantic import ConfigDict, Field, TypeAdapter, ValidationError, with_config
 from mcp.server.fastmcp import Context
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 
 
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def dumps(obj: Any) -> str:
+    """Serialize obj to a compact JSON string using orjson."""
+    return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode()
+
+loads = orjson.loads
+
+def error_json(message: str) -> str:
+    """The {"error": message} JSON that every tool returns on failure."""
+    return orjson.dumps({"error": message}).decode()
+
+def result_set_path(instance_id: str) -> Optional[str]:
+    """Return the DuckDB file holding the result set saved for instance_id, or None if there isn't one."""
+    try:
+        uuid.UUID(instance_id)
+    except ValueError:
+        return None
+    path = os.path.join(os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir()), f"{instance_id}.duckdb")
+    return path if os.path.exists(path) else None
+
+def _result_set_owner_path(duckdb_path: str) -> str:
+    # Kept beside the DuckDB file rather than in it, so query_results SQL against the file
+    # can't change it; that SQL also runs without file system access (see _run_duckdb_query)
+    return duckdb_path + ".owner"
+
+def result_set_owned_by(duckdb_path: str, tenant: str, api_key: Optional[str] = None) -> bool:
+    """
+    True if the result set was saved for tenant, and with api_key when one is given.
+    Result sets saved without an owner record are never considered owned.
+    """
+    try:
+        with open(_result_set_owner_path(duckdb_path), "rb") as f:
+            owner = loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return False
+    if not tenant or owner.get("tenant") != tenant:
+        return False
+    return api_key is None or hmac.compare_digest(owner.get("key", ""), _api_key_hash(api_key))
+
+def iter_result_set_ndjson(duckdb_path: str, batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    Yield every row of a saved result set as newline-delimited JSON, one chunk per batch
+    of rows, so the full data set can be streamed without building it in memory.
+    """
+    con = duckdb.connect(duckdb_path, read_only=True)
+    try:
+        cursor = con.execute("SELECT * FROM my_table")
+        columns = [str(column[0]) for column in cursor.description]
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield b"".join(
+                # Decimals (and anything else orjson can't encode) become strings, as in _to_json_safe
+                orjson.dumps(dict(zip(columns, row)), default=str, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+                for row in batch
+            )
+    finally:
+        con.close()
+
+# The inmydata SDK and DuckDB are synchronous. Run their calls on a bounded pool so
+# a slow warehouse request doesn't stall every other tool call on the event loop.
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("MCP_EXECUTOR_WORKERS", "32")))
+
+async def _run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, func, *args)
+
+# Schemas rarely change, so the enhanced schema JSON is kept per tenant for a while
+# rather than refetched and re-serialized at the start of every agent session.
+# Keyed on (server, tenant, API key hash): the API key is part of the key so a caller can only
+# ever see a schema it fetched itself. OAuth access tokens rotate, so each refreshed token adds an
+# entry; expired entries are dropped on every store and the least recently used entry goes once
+# the cache is full.
+_SCHEMA_CACHE_TTL = int(os.environ.get("MCP_SCHEMA_CACHE_TTL", "3600"))
+_SCHEMA_CACHE_MAX_ENTRIES = 512
+# Entries are (payload, fetched_at, etag), with fetched_at as wall-clock time so it means the
+# same thing in every worker process. The etag is a hash of the schema as returned by the
+# backend, so an expired entry whose schema hasn't changed is reused without re-processing it.
+_schema_cache: OrderedDict[Tuple[str, str, str], Tuple[str, float, str]] = OrderedDict()
+
+def _store_schema(key: Tuple[str, str, str], entry: Tuple[str, float, str]) -> None:
+    _schema_cache[key] = entry
+    _schema_cache.move_to_end(key)
+    expired = [k for k, (_, fetched_at, _) in _schema_cache.items() if entry[1] - fetched_at >= _SCHEMA_CACHE_TTL]
+    for k in expired:
+        del _schema_cache[k]
+    while len(_schema_cache) > _SCHEMA_CACHE_MAX_ENTRIES:
+        _schema_cache.popitem(last=False)
+
+def _schema_etag(schema_json: str) -> str:
+    return hashlib.blake2b(schema_json.encode(), digest_size=8).hexdigest()
+
+def clear_schema_cache(tenant: Optional[str] = None) -> int:
+    """Drop cached schemas for one tenant, or for every tenant if none is given. Returns the number removed."""
+    keys = [key for key in _schema_cache if tenant is None or key[1] == tenant]
+    for key in keys:
+        del _schema_cache[key]
+    return len(keys)
+
+# With several worker processes each one would otherwise fetch and process every tenant's
+# schema itself. When MCP_REDIS_URL is set, processed schemas are also shared through Redis.
+_REDIS_URL = os.environ.get("MCP_REDIS_URL", "")
+
+@functools.cache
+def _shared_cache():
+    """Redis client for caches shared between worker processes, or None when MCP_REDIS_URL isn't set."""
+    if not _REDIS_URL:
+        return None
+    import redis.asyncio as redis
+    return redis.from_url(_REDIS_URL)
+
+def _api_key_hash(api_key: str) -> str:
+    # Cache keys carry a hash of the API key rather than the key itself
+    return hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest()
+
+def _shared_schema_key(server: str, tenant: str, key_hash: str) -> str:
+    return f"mcp:schema:{server}:{tenant}:{key_hash}"
+
+# Time of the last flush, for every tenant or for one. Each worker checks these before using its
+# own copy of a schema, so a flush handled by one worker reaches the others as well.
+_SCHEMA_FLUSH_ALL_KEY = "mcp:schema-flushed:*"
+
+def _schema_flush_key(tenant: str) -> str:
+    return f"mcp:schema-flushed:{tenant}"
+
+async def clear_shared_schema_cache(tenant: Optional[str] = None) -> int:
+    """
+    Drop shared schemas for one tenant, or for every tenant if none is given, and record the flush
+    so other workers discard their local copies too. Returns the number of shared schemas removed.
+    """
+    shared = _shared_cache()
+    if shared is None:
+        return 0
+    # Local copies live at most _SCHEMA_CACHE_TTL, so the marker isn't needed for longer
+    await shared.set(_schema_flush_key(tenant) if tenant else _SCHEMA_FLUSH_ALL_KEY, time.time(), ex=_SCHEMA_CACHE_TTL)
+    keys = [key async for key in shared.scan_iter(match=f"mcp:schema:*:{tenant}:*" if tenant else "mcp:schema:*")]
+    if keys:
+        await shared.delete(*keys)
+    return len(keys)
+
+# Bounds on the rows get_rows/get_top_n return inline: at most _MAX_PAGE_ROWS per call, then
+# trimmed further until the rows serialise to under _MAX_INLINE_BYTES of JSON.
+_MAX_PAGE_ROWS = 200
+_MAX_INLINE_BYTES = 50_000
+
+# Financial periods by (server, tenant, calendar, API key hash, date). As with schemas, the API
+# key is part of the key so a caller only ever sees periods fetched with its own key. The periods
+# a date falls in rarely change, so they are reused for an hour, which makes filling in
+# date-range defaults free after the first lookup of the day. The oldest entry is dropped once
+# the cache is full.
+_PERIODS_CACHE_TTL = 3600
+_PERIODS_CACHE_MAX_ENTRIES = 4096
+_periods_cache: Dict[Tuple[str, str, str, str, str], Tuple[Dict[str, Any], float]] = {}
+
+# get_calendar_period_date_range results for calls with no arguments (the current month),
+# by (server, tenant, calendar, API key hash, today). Most date-range calls are this one, so it
+# is answered without any calendar lookups for ten minutes at a time. The API key hash keeps a
+# caller from being served a result fetched with another key.
+_DEFAULT_RANGE_CACHE_TTL = 600
+_DEFAULT_RANGE_CACHE_MAX_ENTRIES = 4096
+_default_range_cache: Dict[Tuple[str, str, str, str, str], Tuple[str, float]] = {}
+
+# Minimum gap, in seconds, between progress notifications sent while get_answer runs.
+_PROGRESS_INTERVAL = 0.1
+
+# Caps how many conversational queries run against the backend at once, across all callers.
+_ANSWER_SEMAPHORE = asyncio.Semaphore(int(os.environ.get("MCP_ANSWER_CONCURRENCY", "8")))
+
+class WhereClause(TypedDict, total=False):
+    """
+    One `where` filter as accepted by get_rows/get_top_n. Declaring the keys gives the
+    tools a real input schema instead of an open object; see parse_where for the defaults.
+    'column'/'name' and 'logic' are accepted as synonyms for 'field' and 'logical'.
+    """
+    field: str
+    column: str
+    name: str
+    op: str
+    value: Union[str, int, float, bool, None]
+    logical: str
+    logic: str
+    start_group: int
+    end_group: int
+    case_insensitive: bool
+
+class BatchItem(TypedDict):
+    """
+    One call in a batch_get request. args are the arguments of the matching single tool:
+    rows -> get_rows_fast, top_n -> get_top_n_fast, periods -> get_financial_periods,
+    period_range -> get_calendar_period_date_range.
+    """
+    op: Literal["rows", "top_n", "periods", "period_range"]
+    args: Dict[str, Any]
+
+# The args of each batch_get op, with the same constraints as the single tools' parameters.
+# Unknown args are rejected rather than ignored.
+_BatchLimit = Annotated[Optional[int], Field(ge=1, le=_MAX_PAGE_ROWS)]
+_BatchOffset = Annotated[int, Field(ge=0)]
+_NonEmptyStr = Annotated[str, Field(min_length=1)]
+
+@with_config(ConfigDict(extra="forbid"))
+class _RowsArgs(TypedDict, total=False):
+    subject: Required[_NonEmptyStr]
+    select: Required[Annotated[List[str], Field(min_length=1)]]
+    where: List[WhereClause]
+    limit: _BatchLimit
+    offset: _BatchOffset
+
+@with_config(ConfigDict(extra="forbid"))
+class _TopNArgs(TypedDict, total=False):
+    subject: Required[_NonEmptyStr]
+    group_by: Required[_NonEmptyStr]
+    order_by: Required[_NonEmptyStr]
+    n: int
+    where: List[WhereClause]
+    limit: _BatchLimit
+    offset: _BatchOffset
+
+@with_config(ConfigDict(extra="forbid"))
+class _PeriodsArgs(TypedDict, total=False):
+    target_date: Optional[str]
+
+@with_config(ConfigDict(extra="forbid"))
+class _PeriodRangeArgs(TypedDict, total=False):
+    financial_year: Optional[int]
+    period_number: Optional[int]
+    period_type: Optional[str]
+
+# mcp_utils method behind each batch_get op, and the validator for its args
+_BATCH_OPS = {
+    "rows": ("get_rows", TypeAdapter(_RowsArgs)),
+    "top_n": ("get_top_n", TypeAdapter(_TopNArgs)),
+    "periods": ("get_financial_periods", TypeAdapter(_PeriodsArgs)),
+    "period_range": ("get_calendar_period_date_range", TypeAdapter(_PeriodRangeArgs)),
+}
+
+# Period types accepted by get_calendar_period_date_range, in the order they are documented.
+PERIOD_TYPES = ("year", "month", "quarter", "week")
+
+def invalid_period_type_error(period_type: str) -> str:
+    return error_json(f"Invalid period_type: {period_type}. Must be one of: {', '.join(PERIOD_TYPES)}")
+
+# The conversational and calendar SDK modules are only needed by some tools, so they
+# are imported on first use rather than when the server starts.
+@functools.cache
+def _conversational_data_driver():
+    from inmydata.ConversationalData import ConversationalDataDriver
+    return ConversationalDataDriver
+
+@functools.cache
+def _calendar_assistant():
+    from inmydata.CalendarAssistant import CalendarAssistant
+    return CalendarAssistant
+
+@functools.cache
+def _period_type_map():
+    from inmydata.CalendarAssistant import CalendarPeriodType
+    return {name: CalendarPeriodType[name] for name in PERIOD_TYPES}
+
+def _requires_tenant(need_calendar: bool = False):
+    """
+    Return a JSON error instead of calling the wrapped method when the tenant
+    (and optionally the calendar) it needs has not been set.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if not self.tenant:
+                return error_json("Tenant not set")
+            if need_calendar and not self.calendar:
+                return error_json("Calendar not set")
+            return await func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
 class mcp_utils:
+    # Instances are cached per caller by server_remote.utils(), so keep them compact
+    __slots__ = ("api_key", "tenant", "calendar", "user", "session_id", "server")
+
     def __init__(
             self, 
             api_key: str,
@@ -105,16 +393,16 @@ class mcp_utils:
             preview_rows = min(markdown_preview_rows, len(df_out))
             if preview_rows > 0:
                 payload["markdown_preview"] = df_out.head(preview_rows).to_markdown(index=False)
-        except Exception:
+        except ImportError:
             # .to_markdown requires tabulate; safe to ignore if unavailable
             pass
 
-        s = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        s = dumps(payload)
 
         # Hard cap by characters—if still too large, fall back to CSV snippet
         if len(s) > max_chars:
             csv_sample = df_out.to_csv(index=False)
-            s = json.dumps({
+            s = dumps({
                 "type": "dataframe",
                 "row_count": total_rows,
                 "returned_rows": len(df_out),
@@ -122,7 +410,7 @@ class mcp_utils:
                 "columns": list(map(str, df.columns)),
                 "data_format": "csv",
                 "csv_sample": csv_sample[: max_chars // 2]  # keep it sane
-            }, ensure_ascii=False, separators=(",", ":"))
+            })
 
         return s
 
@@ -187,7 +475,7 @@ class mcp_utils:
 
     def parse_where(
         self,
-        where: Optional[List[Dict[str, Any]]]
+        where: Optional[List[WhereClause]]
     ) -> List[AIDataFilter]:
         """
         Convert `where` items like:
@@ -239,22 +527,30 @@ class mcp_utils:
         self, 
         rows: pd.DataFrame, 
         total_rows: int, 
-        default_limit: int = 10
+        default_limit: int = 10,
+        limit: Optional[int] = None,
+        offset: int = 0
     ) -> Tuple[pd.DataFrame, str]:
         """
         Saves a DataFrame to a DuckDB database if it exceeds a row limit and returns a truncated sample.
+        Only the first page (offset 0) is saved; later pages would otherwise write a new copy of the
+        full result set on every call.
 
         Args:
             rows (pd.DataFrame): The DataFrame to process.
             total_rows (int): Total number of rows in the DataFrame.
             default_limit (int, optional): Default row limit. Defaults to 10.
+            limit (int, optional): Rows in the returned sample. Defaults to MCP_SAMPLE_ROWS.
+            offset (int, optional): Index of the first row in the returned sample. Defaults to 0.
 
         Returns:
             Tuple[pd.DataFrame, str, str]: (truncated DataFrame, path to DuckDB file or empty string if not saved, instance_id for DuckDB file or empty string if not saved)
         """
-        # Get row limit from environment variable
-        strlimit = os.environ.get("MCP_SAMPLE_ROWS", str(default_limit))
-        limit = int(strlimit) if self.is_int(strlimit) else default_limit
+        # Get row limit from environment variable unless the caller asked for a page size
+        if limit is None:
+            strlimit = os.environ.get("MCP_SAMPLE_ROWS", str(default_limit))
+            limit = int(strlimit) if self.is_int(strlimit) else default_limit
+        limit = min(limit, _MAX_PAGE_ROWS)
 
         # Get DuckDB storage location from environment variable
         duckdblocation = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
@@ -262,7 +558,7 @@ class mcp_utils:
         duckdb_path = ""
         instance_id = ""
         
-        if total_rows > limit:
+        if total_rows > limit and offset == 0:
             instance_id = str(uuid.uuid4())
             print(f"Warning: total_rows={total_rows} exceeds threshold; data may be truncated.")
             
@@ -278,106 +574,127 @@ class mcp_utils:
             
             # Save DuckDB database to disk            
             con.close()
+
+            # Record who the result set belongs to, for the /results endpoint
+            with open(_result_set_owner_path(duckdb_path), "wb") as f:
+                f.write(orjson.dumps({"tenant": self.tenant, "key": _api_key_hash(self.api_key)}))
                       
-            # Truncate DataFrame for sample
-            rows = rows.head(limit)        
+        # Truncate DataFrame for sample
+        rows = rows.iloc[offset:offset + limit]
         return rows, duckdb_path, instance_id    
+
+    def _page_records(self, rows: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Convert a sample to JSON-safe records, dropping rows from the end until it fits in _MAX_INLINE_BYTES."""
+        records = [
+            {str(col): self._to_json_safe(val) for col, val in row.items()}
+            for row in rows.to_dict(orient="records")
+        ]
+        while len(records) > 1 and len(dumps(records)) > _MAX_INLINE_BYTES:
+            records = records[:len(records) // 2]
+        return records
+
+    def _page_info(self, records: List[Dict[str, Any]], total_rows: int, offset: int) -> Dict[str, Any]:
+        """Paging fields for a get_rows/get_top_n result. next_offset is None once the last row has been returned."""
+        next_offset = offset + len(records)
+        return {
+            "offset": offset,
+            "returned_rows": len(records),
+            "next_offset": next_offset if next_offset < total_rows else None
+        }
     
+    @_requires_tenant()
     async def get_rows(
         self,
         subject: str,
         select: List[str],
-        where: Optional[List[Dict[str, Any]]] = None
+        where: Optional[List[WhereClause]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
     ) -> str:
         """
         Retrieve rows with a simple AND-only filter list.
         where: [{"field":"Region","op":"equals","value":"North","logical":"AND"}, {"field":"Sales Value","op":"gte","value":1000,"logical":"AND"}]
         Allowed ops: equals, contains, not_contains, starts_with, gt, lt, gte, lte
         Allows logical:  AND, OR (default is AND)        
-        Returns records (<= limit) and total_count if available.
+        Returns records (<= limit, starting at offset) and total_count if available.
         """
         try:
-            if not self.tenant:
-                return json.dumps({"error": "Tenant not set"})
-
             driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
             print(f"Calling get_rows with subject={subject}, fields={select}, where={where}")
-            rows = driver.get_data(subject, select, self.parse_where(where), None)
+            rows = await _run_blocking(driver.get_data, subject, select, self.parse_where(where), None)
             if rows is None:
-                return json.dumps({"error": "No data returned from get_data"})
+                return error_json("No data returned from get_data")
             
             # Convert DataFrame to simple, LLM-friendly JSON format
             total_rows = len(rows)
 
-            rows, duckdb_file, instanceid = self.save_to_duckdb(rows=rows, total_rows=total_rows)
+            rows, duckdb_file, instanceid = await _run_blocking(self.save_to_duckdb, rows, total_rows, 10, limit, offset)
             if duckdb_file != "":
                 print(f"DuckDB database saved to: {duckdb_file}")
             else:
-                print("Data did not exceed row limit; no DuckDB file created.")
+                # Pages after the first never save a file, whatever the row count
+                if offset == 0:
+                    print("Data did not exceed row limit; no DuckDB file created.")
                 instanceid = ""
             
             # Convert each cell to JSON-safe types
-            records = [
-                {str(col): self._to_json_safe(val) for col, val in row.items()}
-                for row in rows.to_dict(orient="records")
-            ]
+            records = self._page_records(rows)
             
             result = {
                 "subject": subject,
                 "row_count": total_rows,
                 "columns": list(map(str, rows.columns)),
                 "data": records,            
-                "instance_id": instanceid
+                "instance_id": instanceid,
+                **self._page_info(records, total_rows, offset)
             }
             
-            return json.dumps(result, ensure_ascii=False)
+            return dumps(result)
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return error_json(str(e))
 
+    @_requires_tenant()
     async def get_top_n(
         self,
         subject: str,
         group_by: str,
         order_by: str,
         n: int,
-        where: Optional[List[Dict[str, Any]]] = None
+        where: Optional[List[WhereClause]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
     ) -> str:
        """
         Return top/bottom N groups by a metric.
         n>0 => top N, n<0 => bottom N.
-        where uses the same shape as get_rows.
+        where, limit and offset work as in get_rows.
         """
        try:
-           if not self.tenant:
-               return json.dumps({"error": "Tenant not set"})
-
            driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
            print(f"Calling get_top_n with subject={subject}, group_by={group_by}, order_by={order_by}, n={n}, where={where}")
 
-           # Build a TopN filter to only show the Top 10 Sales People based on Sales Value
-           TopN = TopNOption(order_by, n) # Field to order by and number of records to return (Positive for TopN, negative for BottomN)
-           TopNOptions = {}
-           TopNOptions[group_by] = TopN # Apply the Top N option to the group_by field
+           # Apply a TopN option to the group_by field, ordered by order_by
+           # (positive n for TopN, negative for BottomN)
+           top_n_options = {group_by: TopNOption(order_by, n)}
 
-           rows = driver.get_data(subject, [group_by, order_by], self.parse_where(where), TopNOptions)
+           rows = await _run_blocking(driver.get_data, subject, [group_by, order_by], self.parse_where(where), top_n_options)
            if rows is None:
-               return json.dumps({"error": "No data returned from get_top_n"})
+               return error_json("No data returned from get_top_n")
            
            # Convert DataFrame to simple, LLM-friendly JSON format
            total_rows = len(rows)
-           rows, duckdb_file, instanceid = self.save_to_duckdb(rows=rows, total_rows=total_rows)
+           rows, duckdb_file, instanceid = await _run_blocking(self.save_to_duckdb, rows, total_rows, 10, limit, offset)
            
            if duckdb_file != "":
                print(f"DuckDB database saved to: {duckdb_file}")
            else:
-               print("Data did not exceed row limit; no DuckDB file created.")
+               # Pages after the first never save a file, whatever the row count
+               if offset == 0:
+                   print("Data did not exceed row limit; no DuckDB file created.")
                instanceid = ""
            
            # Convert each cell to JSON-safe types
-           records = [
-               {str(col): self._to_json_safe(val) for col, val in row.items()}
-               for row in rows.to_dict(orient="records")
-           ]
+           records = self._page_records(rows)
            
            result = {
                "subject": subject,
@@ -388,17 +705,19 @@ class mcp_utils:
                "row_count": total_rows,
                "columns": list(map(str, rows.columns)),
                "data": records,
-               "instance_id": instanceid
+               "instance_id": instanceid,
+               **self._page_info(records, total_rows, offset)
            }
            
-           return json.dumps(result, ensure_ascii=False)
+           return dumps(result)
        except Exception as e:
-           return json.dumps({"error": str(e)}) 
+           return error_json(str(e)) 
        
     async def query_results(
         self,
         instance_id: str,
-        sql: str
+        sql: str,
+        match_api_key: bool = True
     ) -> str:
        """
         Queries data in a DuckDB database fetching and loaded into that database 
@@ -407,22 +726,16 @@ class mcp_utils:
         this is unique per call to the tool.
         sql: Is the sql that should be executed against the duckdb database which has a single table
         call my_table in it.
+        match_api_key: also require the API key that created the result set, not just the tenant.
         """
        try:
            print(f"Calling query_results with instance_id={instance_id}, sql={sql}")
-           duckdb_location = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
-           print(f"DuckDB file location: {os.path.join(duckdb_location, instance_id)}.duckdb")
-           rows = None
-           # Create connection
-           con = duckdb.connect(os.path.join(duckdb_location, f"{instance_id}.duckdb"), read_only=False)
-           try:
-             # Execute 
-             result = con.execute(sql)
-             rows = result.df()   # Convert to pandas DataFrame
-           except Exception as e:
-             print(f"DuckDB query failed: {str(e)}"  )
-           finally:
-             con.close()  # Always close the connection
+           duckdb_path = result_set_path(instance_id)
+           # Someone else's result set is reported as missing, as on the /results endpoint
+           if duckdb_path is None or not result_set_owned_by(duckdb_path, self.tenant, self.api_key if match_api_key else None):
+               return error_json("Result set not found")
+           print(f"DuckDB file location: {duckdb_path}")
+           rows = await _run_blocking(self._run_duckdb_query, duckdb_path, sql)
            
            # Convert each cell to JSON-safe types
            records = [
@@ -437,10 +750,26 @@ class mcp_utils:
                "instance_id": instance_id
            }
            
-           return json.dumps(result, ensure_ascii=False)
+           return dumps(result)
        except Exception as e:
-           return json.dumps({"errorX": str(e)})
+           return dumps({"errorX": str(e)})
 
+    def _run_duckdb_query(self, duckdb_path: str, sql: str) -> Optional[pd.DataFrame]:
+        rows = None
+        # Create connection. The SQL comes from the caller, so it gets no file system access:
+        # no reading or writing other files (other result sets, owner records) and no ATTACH.
+        con = duckdb.connect(duckdb_path, read_only=False, config={"enable_external_access": False})
+        try:
+            # Execute
+            result = con.execute(sql)
+            rows = result.df()   # Convert to pandas DataFrame
+        except Exception as e:
+            print(f"DuckDB query failed: {str(e)}")
+        finally:
+            con.close()  # Always close the connection
+        return rows
+
+    @_requires_tenant()
     async def get_answer(
         self,
         question: str,
@@ -456,40 +785,22 @@ class mcp_utils:
         Returns:
             JSON string containing the answer, subject used, and any additional metadata
         """
-        from inmydata.ConversationalData import ConversationalDataDriver
-
         try:
-            if not self.tenant:
-                return json.dumps({"error": "Tenant not set"})
-
-            driver = ConversationalDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
-
-            # capture the loop that owns ctx before you register the callback
-            loop = asyncio.get_running_loop()
             progress_counter = 0
-
-            def on_ai_question_update(caller, message):
-                nonlocal progress_counter
-                progress_counter += 1
-                if ctx:
-                    # schedule the coroutine onto the captured loop, thread-safely
-                    fut = asyncio.run_coroutine_threadsafe(
-                        ctx.report_progress(progress=progress_counter, message=message),
-                        loop
-                    )
-
-            driver.on("ai_question_update", on_ai_question_update)
-
             if ctx:
                 await ctx.report_progress(progress=0, message=f"Starting conversational query: {question}")
 
-            answer = await driver.get_answer(question)
+            async for kind, value in self.get_answer_stream(question):
+                if kind == "answer":
+                    answer = value
+                elif ctx:
+                    progress_counter += 1
+                    await ctx.report_progress(progress=progress_counter, message=value)
 
             if ctx:
                 await ctx.report_progress(progress=progress_counter + 1, message=f"Query completed. Subject used: {answer.subject}")
 
-
-            return json.dumps({
+            return dumps({
                 "answer": answer.answer,
                 "subject": answer.subject,
                 "question": question
@@ -498,14 +809,125 @@ class mcp_utils:
         except Exception as e:
             if ctx:
                 await ctx.error(f"Error in get_answer: {str(e)}")
-            return json.dumps({"error": str(e)})
+            return error_json(str(e))
 
 
-    def get_schema(self) -> str:
+    async def get_answer_stream(
+        self,
+        question: str
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Ask a conversational question, yielding ("progress", message) for the driver's status
+        updates while it works and finally ("answer", answer) with the driver's answer object.
+
+        Updates arrive in bursts, so only the latest message from each burst is yielded, at most
+        once per _PROGRESS_INTERVAL. The query keeps running while the caller handles an update.
+        """
+        driver = _conversational_data_driver()(self.tenant, self.server, self.user, self.session_id, self.api_key)
+
+        # capture the loop before registering the callback, which fires on another thread
+        loop = asyncio.get_running_loop()
+        updates: asyncio.Queue = asyncio.Queue()
+
+        def on_ai_question_update(caller, message):
+            # hand the message to the captured loop, thread-safely
+            loop.call_soon_threadsafe(updates.put_nowait, message)
+
+        driver.on("ai_question_update", on_ai_question_update)
+
+        async def ask():
+            async with _ANSWER_SEMAPHORE:
+                return await driver.get_answer(question)
+
+        query = asyncio.create_task(ask())
+        try:
+            while True:
+                next_update = asyncio.ensure_future(updates.get())
+                await asyncio.wait((query, next_update), return_when=asyncio.FIRST_COMPLETED)
+                if not next_update.done():
+                    next_update.cancel()
+                    break
+                message = next_update.result()
+                await asyncio.sleep(_PROGRESS_INTERVAL)
+                while not updates.empty():
+                    message = updates.get_nowait()
+                yield "progress", message
+            yield "answer", await query
+        finally:
+            # Stop the query if the caller gives up on the stream early
+            query.cancel()
+
+    async def get_answers(
+        self,
+        questions: List[str],
+        ctx: Optional[Context] = None
+    ) -> str:
+        """
+        Answer several natural language questions concurrently. The number of questions in flight
+        is bounded by MCP_ANSWER_CONCURRENCY, and progress is reported as each one completes.
+
+        Args:
+            questions: Natural language questions to ask
+
+        Returns:
+            JSON list with one get_answer result per question, in the order asked
+        """
+        completed = 0
+
+        async def answer(question: str) -> Dict[str, Any]:
+            nonlocal completed
+            result = loads(await self.get_answer(question))
+            completed += 1
+            if ctx:
+                await ctx.report_progress(progress=completed, total=len(questions), message=f"Answered {completed} of {len(questions)} questions")
+            return result
+
+        return dumps(await asyncio.gather(*(answer(question) for question in questions)))
+
+    async def batch_get(
+        self,
+        requests: List[BatchItem]
+    ) -> str:
+        """
+        Run several fast lookups concurrently.
+
+        Args:
+            requests: [{"op": "rows" | "top_n" | "periods" | "period_range", "args": {...}}, ...]
+
+        Returns:
+            JSON list with the result of each request, in the order given
+        """
+        async def run(item: BatchItem) -> str:
+            method, validator = _BATCH_OPS[item["op"]]
+            try:
+                args = validator.validate_python(item.get("args") or {})
+            except ValidationError as e:
+                return error_json(f"Invalid args for {item['op']}: {e}")
+            try:
+                if item["op"] == "top_n":
+                    args = {"n": 10, **args}
+                if item["op"] in ("rows", "top_n"):
+                    where_error = invalid_where_error(args.get("where"))
+                    if where_error:
+                        return where_error
+                return await getattr(self, method)(**args)
+            except Exception as e:
+                return error_json(str(e))
+
+        # Each result is already a JSON document, so join them rather than parsing and re-encoding
+        return "[" + ",".join(await asyncio.gather(*(run(item) for item in requests))) + "]"
+
+    @_requires_tenant()
+    async def get_schema(self, etag: Optional[str] = None) -> str:
         """
         Get the available schema. Returns a JSON object that defines the available subjects (tables) and their columns.
 
+        Args:
+            etag: The etag from a previous get_schema result. If the schema hasn't changed since,
+                  only {"etag": ..., "unchanged": true} is returned instead of the full schema.
+
         Returns a JSON string with:
+          - etag: str identifying this version of the schema
           - schemaVersion: int
           - generatedAt: ISO 8601 UTC timestamp
           - source: string identifying this server
@@ -535,27 +957,68 @@ class mcp_utils:
             ]
         """
         try:
-            if not self.tenant:
-               return json.dumps({"error": "Tenant not set"})
-
-            driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
-            schema_json = driver.get_schema("inmydata.MCP.Server")
-            if schema_json is None:
-                return json.dumps({"error": "No schema returned from get_schema"})
-            
-            # Parse the schema and enhance it with dashboard hints
-            try:
-                schema = json.loads(schema_json)
-                
-                # Enhance each subject with dashboard hints and field groups
-                if "subjects" in schema:
-                    for subject in schema["subjects"]:
-                        self._add_dashboard_hints(subject)
-                
-                return json.dumps(schema, ensure_ascii=False, separators=(",", ":"))
-            except json.JSONDecodeError:
-                # If schema is not valid JSON, return as-is
-                return schema_json
+            cache_key = (self.server, self.tenant, _api_key_hash(self.api_key))
+            now = time.time()
+            cached = _schema_cache.get(cache_key)
+            if cached:
+                _schema_cache.move_to_end(cache_key)
+            shared = _shared_cache()
+            shared_key = _shared_schema_key(*cache_key)
+            if shared is not None:
+                try:
+                    if cached:
+                        # Discard the local copy if any worker has flushed the cache since it was fetched
+                        flushed = [float(t) for t in await shared.mget(_SCHEMA_FLUSH_ALL_KEY, _schema_flush_key(self.tenant)) if t]
+                        if flushed and max(flushed) > cached[1]:
+                            cached = None
+                    if not cached:
+                        # Another worker may already have fetched this schema. It keeps the
+                        # original fetch time, so the entry still expires on schedule.
+                        hit = await shared.get(shared_key)
+                        if hit:
+                            payload, shared_etag, fetched_at = loads(hit)
+                            cached = (payload, fetched_at, shared_etag)
+                            _store_schema(cache_key, cached)
+                except Exception as e:
+                    print(f"Shared schema cache read failed: {e}")
+
+            if not cached or now - cached[1] >= _SCHEMA_CACHE_TTL:
+                driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
+                schema_json = await _run_blocking(driver.get_schema, "inmydata.MCP.Server")
+                if schema_json is None:
+                    return error_json("No schema returned from get_schema")
+
+                new_etag = _schema_etag(schema_json)
+                if cached and cached[2] == new_etag:
+                    # Unchanged upstream, so the processed payload is still good
+                    cached = (cached[0], now, new_etag)
+                else:
+                    # Parse the schema and enhance it with dashboard hints
+                    try:
+                        schema = loads(schema_json)
+                    except orjson.JSONDecodeError:
+                        # If schema is not valid JSON, return as-is
+                        return schema_json
+
+                    # Enhance each subject with dashboard hints and field groups
+                    if "subjects" in schema:
+                        for subject in schema["subjects"]:
+                            self._add_dashboard_hints(subject)
+
+                    if isinstance(schema, dict):
+                        schema = {"etag": new_etag, **schema}
+                    cached = (dumps(schema), now, new_etag)
+                _store_schema(cache_key, cached)
+
+                if shared is not None:
+                    try:
+                        await shared.set(shared_key, dumps([cached[0], new_etag, now]), ex=_SCHEMA_CACHE_TTL)
+                    except Exception as e:
+                        print(f"Shared schema cache write failed: {e}")
+
+            if etag and etag == cached[2]:
+                return dumps({"etag": etag, "unchanged": True})
+            return cached[0]
 
         except Exception as e:
             # Mirror your C# error string style
@@ -680,6 +1143,49 @@ class mcp_utils:
         if field_groups:
             subject["fieldGroups"] = field_groups
 
+    async def get_financial_periods_dict(
+        self,
+        target_date: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Get all financial periods (year, quarter, month, week) for a given date as a dict,
+        for callers in this process that would otherwise have to parse the JSON back.
+
+        Args:
+            target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
+
+        Returns:
+            Dict with the date and its FinancialYear, Quarter, Month and Week
+        """
+        if target_date:
+            dt = datetime.fromisoformat(target_date).date()
+        else:
+            dt = date.today()
+
+        cache_key = (self.server, self.tenant, self.calendar, _api_key_hash(self.api_key), dt.isoformat())
+        now = time.monotonic()
+        cached = _periods_cache.get(cache_key)
+        if cached and now - cached[1] < _PERIODS_CACHE_TTL:
+            return cached[0]
+
+        assistant = _calendar_assistant()(self.tenant, self.calendar, self.server, self.api_key)
+        periods = await _run_blocking(assistant.get_financial_periods, dt)
+
+        result = {
+            "periods": {
+                "FinancialYear": periods.year,
+                "Quarter": periods.quarter,
+                "Month": periods.month,
+                "Week": periods.week
+            },
+            "date": dt.isoformat()
+        }
+        if cache_key not in _periods_cache and len(_periods_cache) >= _PERIODS_CACHE_MAX_ENTRIES:
+            del _periods_cache[next(iter(_periods_cache))]
+        _periods_cache[cache_key] = (result, now)
+        return result
+
+    @_requires_tenant(need_calendar=True)
     async def get_financial_periods(
         self,
         target_date: Optional[str] = None
@@ -693,34 +1199,74 @@ class mcp_utils:
         Returns:
             JSON string with all financial periods
         """
-        from inmydata.CalendarAssistant import CalendarAssistant
-
         try:
-            if not self.tenant or not self.calendar:
-                return json.dumps({"error": "Tenant and calendar must be set"})
-
             print("Getting financial periods. API key =", self.api_key)
-            assistant = CalendarAssistant(self.tenant, self.calendar, self.server, self.api_key)
+            return dumps(await self.get_financial_periods_dict(target_date))
 
-            if target_date:
-                dt = datetime.fromisoformat(target_date).date()
-            else:
-                dt = date.today()
+        except Exception as e:
+            return error_json(str(e))
 
-            periods = assistant.get_financial_periods(dt)
+    @_requires_tenant(need_calendar=True)
+    async def get_all_periods(
+        self,
+        target_date: Optional[str] = None
+    ) -> str:
+        """
+        Get the financial periods for a given date together with the start and end
+        dates of the year, quarter, month and week that contain it.
 
-            # Convert SDK/domain objects to JSON-serializable primitives
-            try:
-                serializable = json.dumps(periods)
-            except Exception:
-                serializable = str(periods)
+        The four date range lookups are independent, so they are issued concurrently
+        rather than one after another.
+
+        Args:
+            target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
+
+        Returns:
+            JSON string with the financial year and a date range for each period type
+        """
+        try:
+            assistant = _calendar_assistant()(self.tenant, self.calendar, self.server, self.api_key)
+
+            # Shares the periods cache with get_financial_periods and the date-range defaults
+            current = await self.get_financial_periods_dict(target_date)
+            financial_year = current["periods"]["FinancialYear"]
+
+            period_numbers = {
+                "year": 1,  # Year period number is typically 1
+                "quarter": current["periods"]["Quarter"],
+                "month": current["periods"]["Month"],
+                "week": current["periods"]["Week"],
+            }
+
+            ranges = await asyncio.gather(*(
+                _run_blocking(
+                    assistant.get_calendar_period_date_range,
+                    financial_year,
+                    period_number,
+                    _period_type_map()[period_type]
+                )
+                for period_type, period_number in period_numbers.items()
+            ))
+
+            periods = {}
+            for (period_type, period_number), response in zip(period_numbers.items(), ranges):
+                periods[period_type] = {
+                    "period_number": period_number,
+                    "start_date": response.StartDate.isoformat() if response else None,
+                    "end_date": response.EndDate.isoformat() if response else None
+                }
 
-            return json.dumps({"periods": serializable, "date": dt.isoformat()})
+            return dumps({
+                "date": current["date"],
+                "financial_year": financial_year,
+                "periods": periods
+            })
 
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return error_json(str(e))
 
 
+    @_requires_tenant(need_calendar=True)
     async def get_calendar_period_date_range(
         self,
         financial_year: Optional[int] = None,
@@ -742,27 +1288,24 @@ class mcp_utils:
         Returns:
             JSON string with start_date, end_date, and period info
         """
-        from inmydata.CalendarAssistant import CalendarAssistant, CalendarPeriodType
-
         try:
-            if not self.tenant or not self.calendar:
-                return json.dumps({"error": "Tenant and Calendar variables must be set"})
+            # Reject an unknown period type before doing any calendar lookups
+            if period_type is not None:
+                period_type = period_type.lower()
+                if period_type not in PERIOD_TYPES:
+                    return invalid_period_type_error(period_type)
+
+            all_defaults = financial_year is None and period_number is None and period_type is None
+            if all_defaults:
+                default_key = (self.server, self.tenant, self.calendar, _api_key_hash(self.api_key), date.today().isoformat())
+                cached = _default_range_cache.get(default_key)
+                if cached and time.monotonic() - cached[1] < _DEFAULT_RANGE_CACHE_TTL:
+                    return cached[0]
 
             # If any parameter is missing, use current financial period
             if financial_year is None or period_number is None or period_type is None:
                 # Get current date's financial period info
-                current_periods_result = await self.get_financial_periods(None)
-                current_periods_data = json.loads(current_periods_result)
-                
-                if "error" in current_periods_data:
-                    return current_periods_result
-                
-                # Parse the periods JSON
-                periods_str = current_periods_data.get("periods", "{}")
-                try:
-                    periods = json.loads(periods_str) if isinstance(periods_str, str) else periods_str
-                except:
-                    periods = {}
+                periods = (await self.get_financial_periods_dict(None))["periods"]
                 
                 # Set defaults based on current periods
                 if financial_year is None:
@@ -779,38 +1322,25 @@ class mcp_utils:
                         period_number = periods.get("Quarter", 1)
                     elif period_type == "week":
                         period_number = periods.get("Week", 1)
-                    elif period_type == "year":
-                        period_number = 1  # Year period number is typically 1
                     else:
-                        return json.dumps({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
+                        period_number = 1  # Year period number is typically 1
 
             # Validate we have all required values
             if not financial_year:
-                return json.dumps({"error": "Could not determine financial_year"})
+                return error_json("Could not determine financial_year")
             if not period_number:
-                return json.dumps({"error": "Could not determine period_number"})
+                return error_json("Could not determine period_number")
             if not period_type:
-                return json.dumps({"error": "Could not determine period_type"})
-
-            assistant = CalendarAssistant(self.tenant, self.calendar, self.server, self.api_key)
-
-            period_type_map = {
-                'year': CalendarPeriodType.year,
-                'month': CalendarPeriodType.month,
-                'quarter': CalendarPeriodType.quarter,
-                'week': CalendarPeriodType.week,
-            }
+                return error_json("Could not determine period_type")
 
-            period_type_enum = period_type_map.get(period_type.lower())
-            if not period_type_enum:
-                return json.dumps({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
+            assistant = _calendar_assistant()(self.tenant, self.calendar, self.server, self.api_key)
 
-            response = assistant.get_calendar_period_date_range(financial_year, period_number, period_type_enum)
+            response = await _run_blocking(assistant.get_calendar_period_date_range, financial_year, period_number, _period_type_map()[period_type])
 
             if response is None:
-                return json.dumps({"error": "No date range found for the specified period"})
+                return error_json("No date range found for the specified period")
 
-            return json.dumps({
+            result = dumps({
                 "start_date": response.StartDate.isoformat(),
                 "end_date": response.EndDate.isoformat(),
                 "financial_year": financial_year,
@@ -818,6 +1348,23 @@ class mcp_utils:
                 "period_type": period_type
             })
 
+            if all_defaults:
+                if default_key not in _default_range_cache and len(_default_range_cache) >= _DEFAULT_RANGE_CACHE_MAX_ENTRIES:
+                    del _default_range_cache[next(iter(_default_range_cache))]
+                _default_range_cache[default_key] = (result, time.monotonic())
+            return result
+
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return error_json(str(e))
+
+
+# Every operator parse_where understands, so the tools can reject a bad filter before any I/O
+WHERE_OPS = frozenset(mcp_utils._OP_ALIASES)
 
+def invalid_where_error(where: Optional[List[WhereClause]]) -> Optional[str]:
+    """Return a JSON error for the first filter with an unsupported op, or None if all are valid."""
+    for item in where or ():
+        op = item.get("op")
+        if op and str(op).strip().lower() not in WHERE_OPS:
+            return error_json(f"Unsupported operator: {op!r}")
+    return None
@@ -2,11 +2,15 @@
 Custom RemoteAuthProvider that supports both JWTs and Personal Access Tokens (PATs).
 When a PAT is detected (non-JWT), performs token introspection to get a valid JWT.
 Caches introspection results to avoid repeated requests for the same PAT.
+Keeps the JWKS signing keys warm with a background refresh so token verification
+doesn't wait on the auth server.
 """
+import asyncio
 import httpx
 import os
 import time
 from typing import Optional, Dict, Tuple
+from authlib.jose import JsonWebKey
 from fastmcp.server.auth import RemoteAuthProvider
 from fastmcp.server.auth.providers.jwt import JWTVerifier, AccessToken
 from pydantic import AnyHttpUrl
@@ -27,17 +31,106 @@ class PATAwareJWTVerifier(JWTVerifier):
         introspection_endpoint: Optional[str] = None,
         client_id: Optional[str] = None,
         client_secret: Optional[str] = None,
-        cache_ttl_seconds: int = 300  # Default 5 minutes cache
+        cache_ttl_seconds: int = 300,  # Default 5 minutes cache
+        jwks_refresh_seconds: int = 600  # Default 10 minutes between JWKS refreshes
     ):
         super().__init__(jwks_uri=jwks_uri, issuer=issuer, audience=audience)
         self.introspection_endpoint = introspection_endpoint
         self.client_id = client_id
         self.client_secret = client_secret
         self.cache_ttl_seconds = cache_ttl_seconds
+        self.jwks_refresh_seconds = jwks_refresh_seconds
+        # Pooled client for JWKS and introspection requests, created on first use (see _client)
+        self._http: Optional[httpx.AsyncClient] = None
+        # Serialises JWKS refreshes triggered by cache misses (see _get_jwks_key)
+        self._jwks_lock = asyncio.Lock()
         
         # Cache format: {token_hash: (AccessToken, expiry_timestamp)}
         self._introspection_cache: Dict[str, Tuple[AccessToken, float]] = {}
     
+    def _client(self) -> httpx.AsyncClient:
+        """
+        Shared client for requests to the auth server, so JWKS refreshes and
+        introspection calls reuse warm connections instead of a new TLS handshake each time.
+        """
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=10.0
+            )
+        return self._http
+    
+    async def aclose(self) -> None:
+        """Close the shared client. Call on application shutdown."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+    
+    async def refresh_jwks(self) -> None:
+        """
+        Fetch the JWKS and replace the cached signing keys.
+        The previous keys are kept if the fetch fails.
+        """
+        response = await self._client().get(self.jwks_uri)
+        response.raise_for_status()
+        jwks_data = response.json()
+        
+        keys = {}
+        for key_data in jwks_data.get("keys", []):
+            public_key = JsonWebKey.import_key(key_data).get_public_key()
+            keys[key_data.get("kid") or "_default"] = public_key
+        
+        self._jwks_cache = keys
+        self._jwks_cache_time = time.time()
+    
+    async def refresh_jwks_forever(self) -> None:
+        """
+        Refresh the JWKS every jwks_refresh_seconds until cancelled.
+        Run as a background task for the lifetime of the app.
+        """
+        while True:
+            try:
+                await self.refresh_jwks()
+            except Exception as e:
+                print(f"JWKS refresh failed: {e}")
+            await asyncio.sleep(self.jwks_refresh_seconds)
+    
+    def _cached_jwks_key(self, kid: Optional[str]) -> Optional[str]:
+        """Look up a signing key in the cache. Without a kid, only a single cached key is used."""
+        if kid:
+            return self._jwks_cache.get(kid)
+        if len(self._jwks_cache) == 1:
+            return next(iter(self._jwks_cache.values()))
+        return None
+    
+    async def _get_jwks_key(self, kid: Optional[str]) -> str:
+        """
+        Serve signing keys from the background-refreshed cache, regardless of its age.
+        For an unknown kid (e.g. just after a key rotation) or before the first refresh has
+        completed, refreshes the JWKS through the shared client and looks again.
+        Concurrent misses wait for a single refresh.
+        """
+        key = self._cached_jwks_key(kid)
+        if key is not None:
+            return key
+        
+        async with self._jwks_lock:
+            # Another request may have refreshed the keys while this one waited
+            key = self._cached_jwks_key(kid)
+            if key is not None:
+                return key
+            try:
+                await self.refresh_jwks()
+            except Exception as e:
+                raise ValueError(f"Failed to fetch JWKS: {e}")
+        
+        key = self._cached_jwks_key(kid)
+        if key is None:
+            if kid:
+                raise ValueError(f"Key ID '{kid}' not found in JWKS")
+            raise ValueError("No single key in JWKS for a token without a key ID (kid)")
+        return key
+    
     async def verify_token(self, token: str) -> Optional[AccessToken]:
         """
         Verify a token. First tries JWT verification, then falls back to introspection.
@@ -158,66 +251,66 @@ class PATAwareJWTVerifier(JWTVerifier):
             return None
         
         try:
-            async with httpx.AsyncClient() as client:
-                # Prepare introspection request
-                data = {
-                    "token": token,
-                }
-                
-                # Add client credentials if configured
-                auth = None
-                if self.client_id and self.client_secret:
-                    auth = (self.client_id, self.client_secret)
-                
-                headers = {
-                    "Content-Type": "application/x-www-form-urlencoded"
-                }
-                
-                # Make introspection request
-                response = await client.post(
-                    self.introspection_endpoint,
-                    data=data,
-                    headers=headers,
-                    auth=auth,
-                    timeout=10.0
-                )
-                
-                if response.status_code != 200:
-                    print(f"Introspection failed with status {response.status_code}: {response.text}")
-                    return None
-                
-                introspection_result = response.json()
-                
-                # Check if token is active
-                if not introspection_result.get("active", False):
-                    print("Token is not active according to introspection")
-                    return None
-                
-                # Convert introspection result to AccessToken format
-                # Extract required fields from introspection response
-                client_id = introspection_result.get("client_id", introspection_result.get("azp", "unknown"))
-                
-                # Extract scopes - handle both space-separated string and array formats
-                scopes = introspection_result.get("scope", "")
-                if isinstance(scopes, str):
-                    scopes = scopes.split() if scopes else []
-                elif not isinstance(scopes, list):
-                    scopes = []
-                
-                # Extract expiration
-                expires_at = introspection_result.get("exp")
-                
-                # Create AccessToken with required fields
-                access_token = AccessToken(
-                    token=token,
-                    client_id=client_id,
-                    scopes=scopes,
-                    expires_at=expires_at,
-                    claims=introspection_result
-                )
-                
-                return access_token
-                
+            client = self._client()
+            # Prepare introspection request
+            data = {
+                "token": token,
+            }
+            
+            # Add client credentials if configured
+            auth = None
+            if self.client_id and self.client_secret:
+                auth = (self.client_id, self.client_secret)
+            
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded"
+            }
+            
+            # Make introspection request
+            response = await client.post(
+                self.introspection_endpoint,
+                data=data,
+                headers=headers,
+                auth=auth,
+                timeout=10.0
+            )
+            
+            if response.status_code != 200:
+                print(f"Introspection failed with status {response.status_code}: {response.text}")
+                return None
+            
+            introspection_result = response.json()
+            
+            # Check if token is active
+            if not introspection_result.get("active", False):
+                print("Token is not active according to introspection")
+                return None
+            
+            # Convert introspection result to AccessToken format
+            # Extract required fields from introspection response
+            client_id = introspection_result.get("client_id", introspection_result.get("azp", "unknown"))
+            
+            # Extract scopes - handle both space-separated string and array formats
+            scopes = introspection_result.get("scope", "")
+            if isinstance(scopes, str):
+                scopes = scopes.split() if scopes else []
+            elif not isinstance(scopes, list):
+                scopes = []
+            
+            # Extract expiration
+            expires_at = introspection_result.get("exp")
+            
+            # Create AccessToken with required fields
+            access_token = AccessToken(
+                token=token,
+                client_id=client_id,
+                scopes=scopes,
+                expires_at=expires_at,
+                claims=introspection_result
+            )
+            
+            return access_token
+            
         except httpx.HTTPError as e:
             print(f"HTTP error during token introspection: {e}")
             return None
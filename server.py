@@ -1,11 +1,10 @@
 import os
-import json
-from typing import Optional, List, Dict, Any
+from typing import Annotated, Optional, List
+from pydantic import Field
 from dotenv import load_dotenv
-from inmydata.StructuredData import StructuredDataDriver, AIDataFilter, LogicalOperator, ConditionOperator, TopNOption
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp import Context
-from mcp_utils import mcp_utils
+from mcp_utils import mcp_utils, WhereClause, BatchItem, PERIOD_TYPES, invalid_period_type_error, invalid_where_error, error_json
 import agentic_rag_tool
 
 load_dotenv(".env", override=True)
@@ -21,22 +20,23 @@ if os.getenv("MCP_DEBUG", "0") == "1":
 mcp = FastMCP("inmydata-agent-server")
 
 def utils():
-    try:
-        api_key = os.environ.get('INMYDATA_API_KEY', "")
-        tenant = os.environ.get('INMYDATA_TENANT', "")
-        server = os.environ.get('INMYDATA_SERVER',"inmydata.com")
-        calendar = os.environ.get('INMYDATA_CALENDAR',"default")
-        user = os.environ.get('INMYDATA_USER', 'mcp-agent')
-        session_id = os.environ.get('INMYDATA_SESSION_ID', 'mcp-session')
-        return mcp_utils(api_key, tenant, calendar, user, session_id, server)
-    except Exception as e:
-        raise RuntimeError(f"Error initializing mcp_utils: {e}")
+    api_key = os.environ.get('INMYDATA_API_KEY', "")
+    tenant = os.environ.get('INMYDATA_TENANT', "")
+    server = os.environ.get('INMYDATA_SERVER',"inmydata.com")
+    calendar = os.environ.get('INMYDATA_CALENDAR',"default")
+    user = os.environ.get('INMYDATA_USER', 'mcp-agent')
+    session_id = os.environ.get('INMYDATA_SESSION_ID', 'mcp-session')
+    return mcp_utils(api_key, tenant, calendar, user, session_id, server)
 
-@mcp.tool()
+# Tools return JSON that is already serialized. With structured output enabled FastMCP
+# would also send every result a second time, re-escaped, as {"result": "..."}.
+@mcp.tool(structured_output=False)
 async def get_rows_fast(
-    subject: str = "",
-    select: List[str] = [],
-    where: List[Dict[str, Any]] = [],
+    subject: Annotated[str, Field(min_length=1)],
+    select: Annotated[List[str], Field(min_length=1)],
+    where: List[WhereClause] = [],
+    limit: Annotated[Optional[int], Field(ge=1, le=200)] = None,
+    offset: Annotated[int, Field(ge=0)] = 0,
     ctx: Optional[Context] = None
 ) -> str:
     """
@@ -49,7 +49,11 @@ async def get_rows_fast(
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk. 
     In that case you MUST use the query_results_fast tool to query the results with SQL
-    to get the data you need to answer the question. This is the only way to access larger datasets.    
+    to get the data you need to answer the question. This is the only way to access larger datasets.
+    limit (default set by the server, usually 10; max 200) and offset choose which rows are returned
+    in the data property; next_offset is set when more rows follow. Rows may be trimmed to keep the
+    result small. Only the first page (offset 0) returns an instance_id; to read deep into a large
+    result, query that instance_id with query_results_fast instead of paging.
 
     Examples:
     - "Give me the specific average transaction value and profit margin percentage for each region in 2025"
@@ -67,21 +71,22 @@ async def get_rows_fast(
     The select list should only contain values that have keys in the factFieldTypes or metricFieldTypes dict of the selected subject    
     """
     try:
-        if not subject:
-            return json.dumps({"error": "subject parameter is required"})
-        if not select:
-            return json.dumps({"error": "select parameter is required (list of field names)"})
-        return await utils().get_rows(subject, select, where)
-    except Exception as e:
-        return json.dumps({"error": str(e)})
+        where_error = invalid_where_error(where)
+        if where_error:
+            return where_error
+        return await utils().get_rows(subject, select, where, limit, offset)
+    except RuntimeError as e:
+        return error_json(str(e))
 
-@mcp.tool()
+@mcp.tool(structured_output=False)
 async def get_top_n_fast(
-    subject: str = "",
-    group_by: str = "",
-    order_by: str = "",
+    subject: Annotated[str, Field(min_length=1)],
+    group_by: Annotated[str, Field(min_length=1)],
+    order_by: Annotated[str, Field(min_length=1)],
     n: int = 10,
-    where: List[Dict[str, Any]] = [],
+    where: List[WhereClause] = [],
+    limit: Annotated[Optional[int], Field(ge=1, le=200)] = None,
+    offset: Annotated[int, Field(ge=0)] = 0,
     ctx: Optional[Context] = None
 ) -> str:
    """
@@ -94,7 +99,11 @@ async def get_top_n_fast(
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk.  
     In that case you MUST use the query_results_fast tool to query the results with SQL
-    to get the data you need to answer the question. This is the only way to access larger datasets.     
+    to get the data you need to answer the question. This is the only way to access larger datasets.
+    limit (default set by the server, usually 10; max 200) and offset choose which rows are returned
+    in the data property; next_offset is set when more rows follow. Rows may be trimmed to keep the
+    result small. Only the first page (offset 0) returns an instance_id; to read deep into a large
+    result, query that instance_id with query_results_fast instead of paging.
 
     Example:
     - "Top 10 regions by profit margin in 2025"
@@ -102,20 +111,17 @@ async def get_top_n_fast(
                    where=[{"field":"Financial Year","op":"equals","value":2025,"logical":"AND"}])
     """
    try:
-       if not subject:
-           return json.dumps({"error": "subject parameter is required"})
-       if not group_by:
-           return json.dumps({"error": "group_by parameter is required"})
-       if not order_by:
-           return json.dumps({"error": "order_by parameter is required"})
-       return await utils().get_top_n(subject, group_by, order_by, n, where)
-   except Exception as e:
-       return json.dumps({"error": str(e)}) 
+       where_error = invalid_where_error(where)
+       if where_error:
+           return where_error
+       return await utils().get_top_n(subject, group_by, order_by, n, where, limit, offset)
+   except RuntimeError as e:
+       return error_json(str(e)) 
    
-@mcp.tool()
+@mcp.tool(structured_output=False)
 async def query_results_fast(
-    instance_id: str = "",
-    sql: str = "",
+    instance_id: Annotated[str, Field(min_length=1)],
+    sql: Annotated[str, Field(min_length=1)],
     ctx: Optional[Context] = None
 ) -> str:
    """
@@ -134,17 +140,13 @@ async def query_results_fast(
       -> query_results_fast(dataset_id="", instance_id="", sql="SELECT MAX(CreditLimit - Balance) AS MaxDifference FROM my_table;")
     """
    try:       
-       if not instance_id:
-           return json.dumps({"error": "instance_id parameter is required"})
-       if not sql:
-           return json.dumps({"error": "sql parameter is required"})
        return await utils().query_results(instance_id, sql)
-   except Exception as e:
-       return json.dumps({"error": str(e)})    
+   except RuntimeError as e:
+       return error_json(str(e))    
 
-@mcp.tool()
+@mcp.tool(structured_output=False)
 async def get_answer_slow(
-    question: str = "",
+    question: Annotated[str, Field(min_length=1)],
     ctx: Optional[Context] = None
 ) -> str:
     """
@@ -161,24 +163,50 @@ async def get_answer_slow(
     Returns:
         JSON string containing the answer, subject used, and any additional metadata
     """
-    from inmydata.ConversationalData import ConversationalDataDriver
-    
     try:
-        if not question:
-            return json.dumps({"error": "question parameter is required"})
         return await utils().get_answer(question, ctx)
     
-    except Exception as e:
+    except RuntimeError as e:
         if ctx:
             await ctx.error(f"Error in get_answer: {str(e)}")
-        return json.dumps({"error": str(e)})
+        return error_json(str(e))
+
+@mcp.tool(structured_output=False)
+async def get_answers_slow(
+    questions: Annotated[List[str], Field(min_length=1)],
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    SLOW / EXPENSIVE (fallback) for several questions at once.
+    Same as get_answer_slow, but the questions are answered concurrently, so asking
+    N independent questions here is much quicker than calling get_answer_slow N times.
+    Only use for questions that cannot be expressed with get_rows or get_top_n.
+    
+    Args:
+        questions: Natural language questions to ask (e.g., ["Why did sales drop in March?", "Which region grew fastest last year?"])
+    
+    Returns:
+        JSON list containing, for each question in order, the answer and subject used or an error
+    """
+    try:
+        return await utils().get_answers(questions, ctx)
+    
+    except RuntimeError as e:
+        if ctx:
+            await ctx.error(f"Error in get_answers: {str(e)}")
+        return error_json(str(e))
 
-@mcp.tool()
-def get_schema() -> str:
+@mcp.tool(structured_output=False)
+async def get_schema(etag: Optional[str] = None) -> str:
     """
     Get the available schema. Returns a JSON object that defines the available subjects (tables) and their columns.
 
+    Args:
+        etag: Optional. The etag from a schema you already have. If the schema hasn't changed
+              the result is just {"etag": ..., "unchanged": true} and you should keep using your copy.
+
     Returns a JSON string with:
+      - etag: str identifying this version of the schema
       - schemaVersion: int
       - generatedAt: ISO 8601 UTC timestamp
       - source: string identifying this server
@@ -195,19 +223,20 @@ def get_schema() -> str:
         ]
     """
     try:
-        return utils().get_schema()
+        return await utils().get_schema(etag)
 
-    except Exception as e:
+    except RuntimeError as e:
         # Mirror your C# error string style
         return f"Error retrieving subjects: {e}"
 
-@mcp.tool()
+@mcp.tool(structured_output=False)
 async def get_financial_periods(
     target_date: Optional[str] = None,
     ctx: Optional[Context] = None
 ) -> str:
     """
     Get all financial periods (year, quarter, month, week) for a given date.
+    If you also need the start and end dates of those periods, use get_all_periods instead.
     
     Args:
         target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
@@ -218,11 +247,35 @@ async def get_financial_periods(
     try:
         return await utils().get_financial_periods(target_date)
     
-    except Exception as e:
-        return json.dumps({"error": str(e)})
+    except RuntimeError as e:
+        return error_json(str(e))
 
 
-@mcp.tool()
+@mcp.tool(structured_output=False)
+async def get_all_periods(
+    target_date: Optional[str] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    Get the financial year, quarter, month and week for a given date together with
+    the start and end dates of each of those periods, in a single call.
+    Prefer this over calling get_financial_periods and get_calendar_period_date_range
+    several times when you need more than one period (e.g. "this month vs this quarter").
+    
+    Args:
+        target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
+    
+    Returns:
+        JSON string with the financial year and start_date/end_date for each period type
+    """
+    try:
+        return await utils().get_all_periods(target_date)
+    
+    except RuntimeError as e:
+        return error_json(str(e))
+
+
+@mcp.tool(structured_output=False)
 async def get_calendar_period_date_range(
     financial_year: Optional[int] = None,
     period_number: Optional[int] = None,
@@ -231,6 +284,7 @@ async def get_calendar_period_date_range(
 ) -> str:
     """
     Get the start and end dates for a specific calendar period.
+    Use this for a single period; use get_all_periods when you need several periods for the same date.
     
     Args:
         financial_year: The financial year (use null/None to automatically use current financial year)
@@ -245,45 +299,48 @@ async def get_calendar_period_date_range(
         JSON string with start_date and end_date
     """
     try:
-        # If any parameter is None, fetch current financial periods
-        if financial_year is None or period_number is None or period_type is None:
-            periods_result = await utils().get_financial_periods(None)
-            periods_data = json.loads(periods_result)
-            
-            if "error" in periods_data:
-                return periods_result
-            
-            # Parse the periods JSON
-            periods_str = periods_data.get("periods", "{}")
-            try:
-                periods = json.loads(periods_str) if isinstance(periods_str, str) else periods_str
-            except:
-                periods = {}
-            
-            # Auto-fill missing parameters from current periods
-            if financial_year is None:
-                financial_year = periods.get("FinancialYear", periods.get("Year", 0))
-            
-            if period_number is None:
-                # Default to current month if not specified
-                period_number = periods.get("Month", periods.get("Period", 1))
-            
-            if period_type is None:
-                period_type = "month"  # Default to month
-        
-        if not financial_year:
-            return json.dumps({"error": "Could not determine financial_year"})
-        if not period_number:
-            return json.dumps({"error": "Could not determine period_number"})
-        if not period_type:
-            return json.dumps({"error": "period_type parameter is required"})
-            
+        # Reject an unknown period type before resolving credentials or fetching periods
+        if period_type is not None and period_type.lower() not in PERIOD_TYPES:
+            return invalid_period_type_error(period_type)
+
+        # Missing parameters are filled in from today's financial periods by mcp_utils
         return await utils().get_calendar_period_date_range(financial_year, period_number, period_type)
     
-    except Exception as e:
-        return json.dumps({"error": str(e)})
+    except RuntimeError as e:
+        return error_json(str(e))
 
 
+@mcp.tool(structured_output=False)
+async def batch_get(
+    requests: Annotated[List[BatchItem], Field(min_length=1)],
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    Run several fast lookups in one call; they are executed concurrently.
+    Use this instead of calling get_rows_fast, get_top_n_fast, get_financial_periods or
+    get_calendar_period_date_range several times in a row.
+
+    Args:
+        requests: List of {"op": ..., "args": {...}} where op is one of
+            - "rows": args as for get_rows_fast (subject, select, where, limit, offset)
+            - "top_n": args as for get_top_n_fast (subject, group_by, order_by, n, where, limit, offset)
+            - "periods": args as for get_financial_periods (target_date)
+            - "period_range": args as for get_calendar_period_date_range (financial_year, period_number, period_type)
+
+    Example:
+        batch_get(requests=[
+            {"op": "periods", "args": {}},
+            {"op": "top_n", "args": {"subject": "Sales", "group_by": "Region", "order_by": "Sales Value", "n": 5}}
+        ])
+
+    Returns:
+        JSON list with the result of each request, in the order given
+    """
+    try:
+        return await utils().batch_get(requests)
+    except RuntimeError as e:
+        return error_json(str(e))
+
 agentic_rag_tool.register(mcp)
 
 
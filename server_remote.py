@@ -1,14 +1,25 @@
-import json
+import asyncio
+import functools
+import hashlib
+import hmac
+import logging
 import os
+import sys
+import time
 import httpx
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Annotated, Optional, List, Dict, Tuple
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastmcp import FastMCP, Context
 from fastapi import FastAPI
-from mcp_utils import mcp_utils
+from mcp_utils import mcp_utils, WhereClause, BatchItem, clear_schema_cache, clear_shared_schema_cache, result_set_path, result_set_owned_by, iter_result_set_ndjson, PERIOD_TYPES, invalid_period_type_error, invalid_where_error, error_json, dumps
 from fastmcp.server.dependencies import get_http_headers, get_http_request
-from pydantic import AnyHttpUrl
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from pydantic import AnyHttpUrl, Field
 from pat_jwt_auth import PATAwareJWTVerifier, PATSupportingRemoteAuthProvider
 from starlette.requests import Request
 import agentic_rag_tool
@@ -24,6 +35,7 @@ INMYDATA_USE_OAUTH = os.environ.get('INMYDATA_USE_OAUTH', 'false').lower() == 't
 INMYDATA_INTROSPECTION_CLIENT_ID = os.environ.get('INMYDATA_INTROSPECTION_CLIENT_ID', '')
 INMYDATA_INTROSPECTION_CLIENT_SECRET = os.environ.get('INMYDATA_INTROSPECTION_CLIENT_SECRET', '')
 INMYDATA_TOKEN_CACHE_TTL = int(os.environ.get('INMYDATA_TOKEN_CACHE_TTL', '300'))  # Default 5 minutes
+INMYDATA_ADMIN_TOKEN = os.environ.get('INMYDATA_ADMIN_TOKEN', '')
 
 # Configure token validation for your identity provider with PAT support
 token_verifier = PATAwareJWTVerifier(
@@ -61,15 +73,56 @@ class MCPPathRewriteMiddleware:
             return await self.app(new_scope, receive, send)
         return await self.app(scope, receive, send)
 
+# Values advertised by the OAuth discovery documents, shared by both documents
+_OAUTH_SCOPES = ("openid", "profile", "inmydata.Developer.AI")
+_OAUTH_GRANT_TYPES = ("authorization_code", "refresh_token")
+_OAUTH_RESPONSE_TYPES = ("code",)
+_OAUTH_CLIENT_AUTH_METHODS = ("client_secret_post",)
+_OAUTH_CODE_CHALLENGE_METHODS = ("S256",)
+_OAUTH_BEARER_METHODS = ("header",)
+
+# Hop-by-hop headers describe the upstream connection and must not be forwarded by a proxy.
+# content-length/content-encoding are dropped too because httpx hands back the decoded body.
+_HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "content-length",
+    "content-encoding",
+})
+
 if INMYDATA_USE_OAUTH:
     # Initialise FastMCP, and mount to FastAPI app that provides custom auth endpoints
     mcp = FastMCP(name="inmydata-agent-server", auth=auth)
     mcp_app = mcp.http_app("/")
     #mcp_app.add_middleware(MCPPathRewriteMiddleware)
 
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # One pooled client for the token proxy, so token exchanges reuse warm connections
+        app.state.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=500, max_keepalive_connections=100),
+            timeout=30.0
+        )
+        # Keep the JWKS signing keys warm so verifying a token never waits on the auth server
+        jwks_refresher = asyncio.create_task(token_verifier.refresh_jwks_forever())
+        try:
+            async with mcp_app.lifespan(app):
+                yield
+        finally:
+            jwks_refresher.cancel()
+            await app.state.http.aclose()
+            await token_verifier.aclose()
+
      # Create the main FastAPI app and mount the MCP app
 
-    app = FastAPI(lifespan=mcp_app.lifespan)
+    app = FastAPI(lifespan=lifespan)
     app.mount("/mcp", mcp_app)
     app.add_middleware(MCPPathRewriteMiddleware)
 
@@ -86,38 +139,39 @@ if INMYDATA_USE_OAUTH:
     
     
     #--- Custom OAuth endpoints ---
-    @app.get("/.well-known/oauth-protected-resource/mcp")
-    @app.get("/.well-known/oauth-protected-resource")
+    # The discovery documents only depend on environment read at startup, so serialise them once
+    _OAUTH_PROTECTED_RESOURCE = dumps({
+        "resource": f"https://{INMYDATA_MCP_HOST}/mcp",
+        "authorization_servers": (f"https://{INMYDATA_AUTH_SERVER}/",),
+        "scopes_supported": _OAUTH_SCOPES,
+        "bearer_methods_supported": _OAUTH_BEARER_METHODS
+    }).encode()
+    _OAUTH_METADATA = dumps({
+        "issuer": f"https://{INMYDATA_AUTH_SERVER}/",
+        "authorization_endpoint": f"https://{INMYDATA_AUTH_SERVER}/connect/authorize",
+        "token_endpoint": f"https://{INMYDATA_MCP_HOST}/connect/token",
+        "registration_endpoint": f"https://{INMYDATA_AUTH_SERVER}/register",
+        "grant_types_supported": _OAUTH_GRANT_TYPES,
+        "scopes_supported": _OAUTH_SCOPES,
+        "response_types_supported": _OAUTH_RESPONSE_TYPES,
+        "token_endpoint_auth_methods_supported": _OAUTH_CLIENT_AUTH_METHODS,
+        "revocation_endpoint": f"https://{INMYDATA_MCP_HOST}/revoke",
+        "revocation_endpoint_auth_methods_supported": _OAUTH_CLIENT_AUTH_METHODS,
+        "code_challenge_methods_supported": _OAUTH_CODE_CHALLENGE_METHODS
+    }).encode()
+
+    @app.get("/.well-known/oauth-protected-resource/mcp", response_class=Response)
+    @app.get("/.well-known/oauth-protected-resource", response_class=Response)
     def oauth_protected_resource():
-        return JSONResponse(status_code=401, content={"resource": f"https://{INMYDATA_MCP_HOST}/mcp", "authorization_servers": [f"https://{INMYDATA_AUTH_SERVER}/"], "scopes_supported": ["openid", "profile", "inmydata.Developer.AI"], "bearer_methods_supported": ["header"]})
+        return Response(status_code=401, content=_OAUTH_PROTECTED_RESOURCE, media_type="application/json")
     # Connectors are failing to go to the correct endpoints when we only offer /.well-known/oauth-protected-resource.  Serving the endpoint metadata here allows us to fix this.
-    @app.get("/.well-known/oauth-authorization-server")
-    @app.get("/.well-known/oauth-authorization-server/mcp")
-    @app.get("/.well-known/openid-configuration")
-    @app.get("/.well-known/openid-configuration/mcp")
-    @app.get("/mcp/.well-known/openid-configuration")
+    @app.get("/.well-known/oauth-authorization-server", response_class=Response)
+    @app.get("/.well-known/oauth-authorization-server/mcp", response_class=Response)
+    @app.get("/.well-known/openid-configuration", response_class=Response)
+    @app.get("/.well-known/openid-configuration/mcp", response_class=Response)
+    @app.get("/mcp/.well-known/openid-configuration", response_class=Response)
     async def oauth_metadata():
-        return {
-            "issuer": f"https://{INMYDATA_AUTH_SERVER}/",
-            "authorization_endpoint": f"https://{INMYDATA_AUTH_SERVER}/connect/authorize",
-            "token_endpoint": f"https://{INMYDATA_MCP_HOST}/connect/token",
-            "registration_endpoint": f"https://{INMYDATA_AUTH_SERVER}/register",
-            "grant_types_supported": ["authorization_code", "refresh_token"],
-              "scopes_supported": [
-                "openid",
-                "profile",
-                "inmydata.Developer.AI"
-            ],
-            "response_types_supported": ["code"],
-            "token_endpoint_auth_methods_supported": ["client_secret_post"],
-             "revocation_endpoint": f"https://{INMYDATA_MCP_HOST}/revoke",
-             "revocation_endpoint_auth_methods_supported": [
-                "client_secret_post"
-            ],
-             "code_challenge_methods_supported": [
-                "S256"
-            ]
-        }
+        return Response(content=_OAUTH_METADATA, media_type="application/json")
 
     # For reasons I don't understand, connectors fail when going to the auth server's token endpoint directly.  This proxy seems to fix it.
     @app.post("/connect/token")
@@ -126,29 +180,86 @@ if INMYDATA_USE_OAUTH:
         # Get form data from the request body
         form_data = await request.form()
 
-        # Prepare headers for form data
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }
+        # FormData is a mapping, so httpx can encode it as-is (and sets the form Content-Type itself)
+        response = await request.app.state.http.post(
+            f"https://{INMYDATA_AUTH_SERVER}/connect/token",
+            data=form_data
+        )
+
+        # Pass the upstream body through as-is rather than decoding and re-encoding the JSON
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={k: v for k, v in response.headers.items() if k.lower() not in _HOP_BY_HOP_HEADERS},
+            media_type="application/json"
+        )
+else:
+    # Initialise FastMCP without auth
+    mcp = FastMCP(name="inmydata-agent-server")
+
+async def flush_schema_cache(request: Request):
+    """
+    Drop cached get_schema results (optionally for a single ?tenant=) so the next call refetches them.
+    Without MCP_REDIS_URL only the worker handling this request is flushed.
+    """
+    # Disabled unless an admin token has been configured
+    if not INMYDATA_ADMIN_TOKEN:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    supplied = request.headers.get('authorization', '').replace('Bearer ', '')
+    if not hmac.compare_digest(supplied.encode(), INMYDATA_ADMIN_TOKEN.encode()):
+        return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+    tenant = request.query_params.get('tenant') or None
+    flushed = clear_schema_cache(tenant) + await clear_shared_schema_cache(tenant)
+    return JSONResponse(content={"flushed": flushed})
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"https://{INMYDATA_AUTH_SERVER}/connect/token",
-                data=dict(form_data),
-                headers=headers
+if INMYDATA_USE_OAUTH:
+    app.add_api_route("/admin/flush-schema", flush_schema_cache, methods=["POST"])
+else:
+    mcp.custom_route("/admin/flush-schema", methods=["POST"])(flush_schema_cache)
 
-            )
+async def stream_result_set(request: Request):
+    """
+    Stream every row of a result set saved by get_rows_fast/get_top_n_fast as newline-delimited JSON.
+    Only the tenant that created the result set can read it; in the legacy flow the API key must match too.
+    """
+    token = request.headers.get('authorization', '').replace('Bearer ', '')
+    if not token:
+        return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+    if INMYDATA_USE_OAUTH:
+        try:
+            tenant = await get_tenant(token)
+        except RuntimeError:
+            return JSONResponse(status_code=401, content={"error": "Unauthorized"})
+        api_key = None
+    else:
+        # Resolve the tenant and API key the same way _create_utils does
+        tenant = request.query_params.get('tenant') or request.headers.get('x-inmydata-tenant', '')
+        api_key = os.environ.get(_tenant_env_key(tenant)) or token
+    duckdb_path = result_set_path(request.path_params['instance_id'])
+    # Someone else's result set is reported as missing rather than forbidden
+    if duckdb_path is None or not result_set_owned_by(duckdb_path, tenant, api_key):
+        return JSONResponse(status_code=404, content={"error": "Result set not found"})
+    return StreamingResponse(iter_result_set_ndjson(duckdb_path), media_type="application/x-ndjson")
 
-            return JSONResponse(
-                content=response.json(),
-                status_code=response.status_code,
-                headers=dict(response.headers)
-            )    
+if INMYDATA_USE_OAUTH:
+    app.add_api_route("/results/{instance_id}", stream_result_set, methods=["GET"])
 else:
-    # Initialise FastMCP without auth
-    mcp = FastMCP(name="inmydata-agent-server")
+    mcp.custom_route("/results/{instance_id}", methods=["GET"])(stream_result_set)
+
+# Tenant resolved for each bearer token, keyed on a hash of the token so the token itself
+# isn't held in memory. Saves re-verifying the JWT on every tool call in a session;
+# entries expire with the token and the oldest entry is dropped once the cache is full.
+_TENANT_CACHE_MAX_ENTRIES = 4096
+_tenant_cache: Dict[bytes, Tuple[str, float]] = {}
 
 async def get_tenant(token: str) -> str:
+    cache_key = hashlib.sha256(token.encode()).digest()[:16]
+    cached = _tenant_cache.get(cache_key)
+    if cached:
+        if time.time() < cached[1] - 5:
+            return cached[0]
+        del _tenant_cache[cache_key]
+
     access_token = await token_verifier.verify_token(token)
 
     if access_token is None:
@@ -161,64 +272,124 @@ async def get_tenant(token: str) -> str:
     
     if not tenant:
         raise RuntimeError("No tenant information found in token")
+
+    expiry = access_token.claims.get("exp")
+    if not isinstance(expiry, (int, float)):
+        expiry = time.time() + INMYDATA_TOKEN_CACHE_TTL
+    if len(_tenant_cache) >= _TENANT_CACHE_MAX_ENTRIES:
+        del _tenant_cache[next(iter(_tenant_cache))]
+    _tenant_cache[cache_key] = (tenant, expiry)
     
     return tenant
 
-async def utils() -> mcp_utils:
+# Credential headers read on every tool call, in the order _read_headers returns them
+_HEADER_KEYS = tuple(sys.intern(key) for key in (
+    'authorization',
+    'x-inmydata-tenant',
+    'x-inmydata-server',
+    'x-inmydata-calendar',
+    'x-inmydata-user',
+    'x-inmydata-session-id',
+))
+
+def _read_headers(headers: Dict[str, str]) -> Tuple[str, ...]:
+    """Return (authorization, tenant, server, calendar, user, session_id) from the headers, '' when absent."""
+    return tuple([headers.get(key, '') for key in _HEADER_KEYS])
+
+@dataclass(frozen=True, slots=True)
+class TenantCtx:
+    """The raw credentials of one tool call, '' when absent. Hashable, so it doubles as the utils cache key."""
+    authorization: str
+    tenant: str
+    server: str
+    calendar: str
+    user: str
+    session_id: str
+    query_tenant: str
+
+_TENANT_CTX: ContextVar[Optional[TenantCtx]] = ContextVar("tenant_ctx", default=None)
+
+def _query_tenant() -> str:
+    """Return the 'tenant' query parameter of the current request, '' when absent."""
     try:
-        if INMYDATA_USE_OAUTH:
-            # OAuth flow - use bearer token and extract tenant from token
-            headers = get_http_headers()
-            api_key = headers.get('authorization', '').replace('Bearer ', '')
-            tenant = headers.get('x-inmydata-tenant', await get_tenant(api_key))
-            server = headers.get('x-inmydata-server', os.environ.get('INMYDATA_SERVER',"inmydata.com"))
-            calendar = headers.get('x-inmydata-calendar', 'Default')
-            user = headers.get('x-inmydata-user', 'mcp-agent')
-            session_id = headers.get('x-inmydata-session-id', 'mcp-session')
-            return mcp_utils(api_key, tenant, calendar, user, session_id, server)
-        else:
-            # Legacy flow - use API key from headers or environment variables
-            # Fetch headers and request (if available). Preference: query parameter 'tenant' > header 'x-inmydata-tenant'
-            headers = get_http_headers()
-            tenant = ''
-            try:
-                req = get_http_request()
-                if req is not None:
-                    tenant = req.query_params.get('tenant', '')
-            except Exception:
-                # If get_http_request isn't available or fails, ignore and fall back to headers
-                tenant = ''
-
-            # Only use header tenant if query param not provided
-            if not tenant:
-                tenant = headers.get('x-inmydata-tenant', '')
-
-            # Check if we can pick up the api key for this tenant from env first, otherwise look for header
-            api_key = ""
-            if tenant.upper() + "_API_KEY" in os.environ:
-                api_key = os.environ.get(tenant.upper() + "_API_KEY", "")
-            else:
-                api_key = headers.get('authorization', '').replace('Bearer ', '')
-
-            server = headers.get('x-inmydata-server', '')
-            if not server:
-                server = os.environ.get('INMYDATA_SERVER',"inmydata.com")
-
-            calendar = headers.get('x-inmydata-calendar', '')
-            if not calendar:
-                calendar = 'Default'
-            user = headers.get('x-inmydata-user', 'mcp-agent')
-            session_id = headers.get('x-inmydata-session-id', 'mcp-session')
-
-            return mcp_utils(api_key, tenant, calendar, user, session_id, server)
-    except Exception as e:
-        raise RuntimeError(f"Error initializing mcp_utils: {e}")
-
-@mcp.tool()
+        req = get_http_request()
+        if req is not None:
+            return req.query_params.get('tenant', '')
+    except RuntimeError:
+        # Raised when there is no active HTTP request; fall back to headers
+        pass
+    return ''
+
+@functools.lru_cache(maxsize=256)
+def _tenant_env_key(tenant: str) -> str:
+    """Name of the environment variable holding a tenant's API key in the legacy flow."""
+    return tenant.upper() + "_API_KEY"
+
+def _tenant_ctx_from_request() -> TenantCtx:
+    """Parse the credentials for the current request. The query parameter only matters in the legacy flow."""
+    return TenantCtx(*_read_headers(get_http_headers()), '' if INMYDATA_USE_OAUTH else _query_tenant())
+
+class TenantContextMiddleware(Middleware):
+    """Parse the credentials once per tool call and publish them to utils() through _TENANT_CTX."""
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        token = _TENANT_CTX.set(_tenant_ctx_from_request())
+        try:
+            return await call_next(context)
+        finally:
+            _TENANT_CTX.reset(token)
+
+mcp.add_middleware(TenantContextMiddleware())
+
+async def _create_utils(ctx: TenantCtx) -> mcp_utils:
+    calendar, user, session_id, server = ctx.calendar or 'Default', ctx.user or 'mcp-agent', ctx.session_id or 'mcp-session', ctx.server or INMYDATA_SERVER
+    if INMYDATA_USE_OAUTH:
+        # OAuth flow - use bearer token and extract tenant from token
+        api_key = ctx.authorization.replace('Bearer ', '')
+        # Only verify the token for its tenant when the header doesn't already supply one
+        tenant = ctx.tenant or await get_tenant(api_key)
+        return mcp_utils(api_key, tenant, calendar, user, session_id, server)
+    else:
+        # Legacy flow - use API key from headers or environment variables
+        # Preference: query parameter 'tenant' > header 'x-inmydata-tenant'
+        tenant = ctx.query_tenant or ctx.tenant
+
+        # Check if we can pick up the api key for this tenant from env first, otherwise look for header
+        api_key = os.environ.get(_tenant_env_key(tenant)) or ctx.authorization.replace('Bearer ', '')
+
+        return mcp_utils(api_key, tenant, calendar, user, session_id, server)
+
+# mcp_utils instances keyed on every credential that goes into them, so repeat calls with the
+# same headers skip the tenant lookup and constructor. Least recently used entries are dropped
+# once the cache is full, and entries are rebuilt after a minute.
+_UTILS_CACHE_TTL = 60
+_UTILS_CACHE_MAX_ENTRIES = 512
+_UTILS_CACHE: OrderedDict[TenantCtx, Tuple[mcp_utils, float]] = OrderedDict()
+
+async def utils() -> mcp_utils:
+    # Tool calls arrive with the context already parsed by TenantContextMiddleware
+    ctx = _TENANT_CTX.get() or _tenant_ctx_from_request()
+    cached = _UTILS_CACHE.get(ctx)
+    if cached and time.time() < cached[1]:
+        _UTILS_CACHE.move_to_end(ctx)
+        return cached[0]
+
+    # No lock: two concurrent misses for the same key just build the instance twice
+    instance = await _create_utils(ctx)
+    _UTILS_CACHE[ctx] = (instance, time.time() + _UTILS_CACHE_TTL)
+    _UTILS_CACHE.move_to_end(ctx)
+    if len(_UTILS_CACHE) > _UTILS_CACHE_MAX_ENTRIES:
+        _UTILS_CACHE.popitem(last=False)
+    return instance
+
+# Tools return JSON that is already serialized. With an output schema FastMCP would
+# also send every result a second time, re-escaped, as {"result": "..."}.
+@mcp.tool(output_schema=None)
 async def get_rows_fast(
-    subject: str = "",
-    select: List[str] = [],
-    where: List[Dict[str, Any]] = []
+    subject: Annotated[str, Field(min_length=1)],
+    select: Annotated[List[str], Field(min_length=1)],
+    where: List[WhereClause] = [],
+    limit: Annotated[Optional[int], Field(ge=1, le=200)] = None,
+    offset: Annotated[int, Field(ge=0)] = 0
 ) -> str:
     """
     FAST PATH (recommended).
@@ -230,7 +401,11 @@ async def get_rows_fast(
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk. 
     In that case you MUST use the query_results_fast tool to query the results with SQL
-    to get the data you need to answer the question. This is the only way to access larger datasets.    
+    to get the data you need to answer the question. This is the only way to access larger datasets.
+    limit (default set by the server, usually 10; max 200) and offset choose which rows are returned
+    in the data property; next_offset is set when more rows follow. Rows may be trimmed to keep the
+    result small. Only the first page (offset 0) returns an instance_id; to read deep into a large
+    result, query that instance_id with query_results_fast instead of paging.
 
     Examples:
     - "Give me the specific average transaction value and profit margin percentage for each region in 2025"
@@ -244,21 +419,22 @@ async def get_rows_fast(
     Allowed ops: equals, contains, not_contains, starts_with, gt, lt, gte, lte
     """
     try:
-        if not subject:
-            return json.dumps({"error": "subject parameter is required"})
-        if not select:
-            return json.dumps({"error": "select parameter is required (list of field names)"})
-        return await (await utils()).get_rows(subject, select, where)
-    except Exception as e:
-        return json.dumps({"error": str(e)})
-
-@mcp.tool()
+        where_error = invalid_where_error(where)
+        if where_error:
+            return where_error
+        return await (await utils()).get_rows(subject, select, where, limit, offset)
+    except RuntimeError as e:
+        return error_json(str(e))
+
+@mcp.tool(output_schema=None)
 async def get_top_n_fast(
-    subject: str = "",
-    group_by: str = "",
-    order_by: str = "",
+    subject: Annotated[str, Field(min_length=1)],
+    group_by: Annotated[str, Field(min_length=1)],
+    order_by: Annotated[str, Field(min_length=1)],
     n: int = 10,
-    where: List[Dict[str, Any]] = []
+    where: List[WhereClause] = [],
+    limit: Annotated[Optional[int], Field(ge=1, le=200)] = None,
+    offset: Annotated[int, Field(ge=0)] = 0
 ) -> str:
    """
     FAST PATH for rankings and leaderboards.
@@ -270,7 +446,11 @@ async def get_top_n_fast(
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk.  
     In that case you MUST use the query_results_fast tool to query the results with SQL
-    to get the data you need to answer the question. This is the only way to access larger datasets.     
+    to get the data you need to answer the question. This is the only way to access larger datasets.
+    limit (default set by the server, usually 10; max 200) and offset choose which rows are returned
+    in the data property; next_offset is set when more rows follow. Rows may be trimmed to keep the
+    result small. Only the first page (offset 0) returns an instance_id; to read deep into a large
+    result, query that instance_id with query_results_fast instead of paging.
 
     Example:
     - "Top 10 regions by profit margin in 2025"
@@ -278,20 +458,17 @@ async def get_top_n_fast(
                    where=[{"field":"Financial Year","op":"equals","value":2025}])
     """
    try:
-       if not subject:
-           return json.dumps({"error": "subject parameter is required"})
-       if not group_by:
-           return json.dumps({"error": "group_by parameter is required"})
-       if not order_by:
-           return json.dumps({"error": "order_by parameter is required"})
-       return await (await utils()).get_top_n(subject, group_by, order_by, n, where)
-   except Exception as e:
-       return json.dumps({"error": str(e)}) 
+       where_error = invalid_where_error(where)
+       if where_error:
+           return where_error
+       return await (await utils()).get_top_n(subject, group_by, order_by, n, where, limit, offset)
+   except RuntimeError as e:
+       return error_json(str(e)) 
    
-@mcp.tool()
+@mcp.tool(output_schema=None)
 async def query_results_fast(
-    instance_id: str = "",
-    sql: str = "",
+    instance_id: Annotated[str, Field(min_length=1)],
+    sql: Annotated[str, Field(min_length=1)],
     ctx: Optional[Context] = None
 ) -> str:
    """
@@ -310,17 +487,14 @@ async def query_results_fast(
       -> query_results_fast(dataset_id="", instance_id="", sql="SELECT MAX(CreditLimit - Balance) AS MaxDifference FROM my_table;")
     """
    try:       
-       if not instance_id:
-           return json.dumps({"error": "instance_id parameter is required"})
-       if not sql:
-           return json.dumps({"error": "sql parameter is required"})
-       return await (await utils()).query_results(instance_id, sql)
-   except Exception as e:
-       return json.dumps({"error": str(e)})      
-
-@mcp.tool()
+       # OAuth access tokens rotate, so there the verified tenant alone identifies the owner
+       return await (await utils()).query_results(instance_id, sql, match_api_key=not INMYDATA_USE_OAUTH)
+   except RuntimeError as e:
+       return error_json(str(e))      
+
+@mcp.tool(output_schema=None)
 async def get_answer_slow(
-    question: str = "",
+    question: Annotated[str, Field(min_length=1)],
     ctx: Optional[Context] = None
 ) -> str:
     """
@@ -337,27 +511,55 @@ async def get_answer_slow(
     Returns:
         JSON string containing the answer, subject used, and any additional metadata
     """
-    from inmydata.ConversationalData import ConversationalDataDriver
-    
     try:
-        if not question:
-            return json.dumps({"error": "question parameter is required"})
         if not ctx:
-            return json.dumps({"error": "context parameter is required"})
+            return error_json("context parameter is required")
         return await (await utils()).get_answer(question, ctx) # type: ignore
     
-    except Exception as e:
+    except RuntimeError as e:
         if ctx:
             await ctx.error(f"Error in get_answer: {str(e)}")
-        return json.dumps({"error": str(e)})
+        return error_json(str(e))
 
 
-@mcp.tool()
-async def get_schema() -> str:
+@mcp.tool(output_schema=None)
+async def get_answers_slow(
+    questions: Annotated[List[str], Field(min_length=1)],
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    SLOW / EXPENSIVE (fallback) for several questions at once.
+    Same as get_answer_slow, but the questions are answered concurrently, so asking
+    N independent questions here is much quicker than calling get_answer_slow N times.
+    Only use for questions that cannot be expressed with get_rows or get_top_n.
+    
+    Args:
+        questions: Natural language questions to ask (e.g., ["Why did sales drop in March?", "Which region grew fastest last year?"])
+    
+    Returns:
+        JSON list containing, for each question in order, the answer and subject used or an error
+    """
+    try:
+        if not ctx:
+            return error_json("context parameter is required")
+        return await (await utils()).get_answers(questions, ctx)
+    
+    except RuntimeError as e:
+        if ctx:
+            await ctx.error(f"Error in get_answers: {str(e)}")
+        return error_json(str(e))
+
+@mcp.tool(output_schema=None)
+async def get_schema(etag: Optional[str] = None) -> str:
     """
     Get the available schema. Returns a JSON object that defines the available subjects (tables) and their columns.
 
+    Args:
+        etag: Optional. The etag from a schema you already have. If the schema hasn't changed
+              the result is just {"etag": ..., "unchanged": true} and you should keep using your copy.
+
     Returns a JSON string with:
+      - etag: str identifying this version of the schema
       - schemaVersion: int
       - generatedAt: ISO 8601 UTC timestamp
       - source: string identifying this server
@@ -374,18 +576,19 @@ async def get_schema() -> str:
         ]
     """
     try:
-        return (await utils()).get_schema()
+        return await (await utils()).get_schema(etag)
 
-    except Exception as e:
+    except RuntimeError as e:
         # Mirror your C# error string style
         return f"Error retrieving subjects: {e}"
 
-@mcp.tool()
+@mcp.tool(output_schema=None)
 async def get_financial_periods(
     target_date: Optional[str] = None
 ) -> str:
     """
     Get all financial periods (year, quarter, month, week) for a given date.
+    If you also need the start and end dates of those periods, use get_all_periods instead.
     
     Args:
         target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
@@ -396,11 +599,34 @@ async def get_financial_periods(
     try:
         return await (await utils()).get_financial_periods(target_date)
     
-    except Exception as e:
-        return json.dumps({"error": str(e)})
+    except RuntimeError as e:
+        return error_json(str(e))
+
+
+@mcp.tool(output_schema=None)
+async def get_all_periods(
+    target_date: Optional[str] = None
+) -> str:
+    """
+    Get the financial year, quarter, month and week for a given date together with
+    the start and end dates of each of those periods, in a single call.
+    Prefer this over calling get_financial_periods and get_calendar_period_date_range
+    several times when you need more than one period (e.g. "this month vs this quarter").
+    
+    Args:
+        target_date: Date in ISO format (YYYY-MM-DD). If not provided, uses today's date.
+    
+    Returns:
+        JSON string with the financial year and start_date/end_date for each period type
+    """
+    try:
+        return await (await utils()).get_all_periods(target_date)
+    
+    except RuntimeError as e:
+        return error_json(str(e))
 
 
-@mcp.tool()
+@mcp.tool(output_schema=None)
 async def get_calendar_period_date_range(
     financial_year: Optional[int] = None,
     period_number: Optional[int] = None,
@@ -408,6 +634,7 @@ async def get_calendar_period_date_range(
 ) -> str:
     """
     Get the start and end dates for a specific calendar period.
+    Use this for a single period; use get_all_periods when you need several periods for the same date.
     
     Args:
         financial_year: The financial year (use null/None to automatically use current financial year)
@@ -422,44 +649,46 @@ async def get_calendar_period_date_range(
         JSON string with start_date and end_date
     """
     try:
-        # If any parameter is None, fetch current financial periods
-        if financial_year is None or period_number is None or period_type is None:
-            periods_result = await (await utils()).get_financial_periods(None)
-            periods_data = json.loads(periods_result)
-            
-            if "error" in periods_data:
-                return periods_result
-            
-            # Parse the periods JSON
-            periods_str = periods_data.get("periods", "{}")
-            try:
-                periods = json.loads(periods_str) if isinstance(periods_str, str) else periods_str
-            except:
-                periods = {}
-            
-            # Auto-fill missing parameters from current periods
-            if financial_year is None:
-                financial_year = periods.get("FinancialYear", periods.get("Year", 0))
-            
-            if period_number is None:
-                # Default to current month if not specified
-                period_number = periods.get("Month", periods.get("Period", 1))
-            
-            if period_type is None:
-                period_type = "month"  # Default to month
-        
-        if not financial_year:
-            return json.dumps({"error": "Could not determine financial_year"})
-        if not period_number:
-            return json.dumps({"error": "Could not determine period_number"})
-        if not period_type:
-            return json.dumps({"error": "period_type parameter is required"})
-            
+        # Reject an unknown period type before resolving credentials or fetching periods
+        if period_type is not None and period_type.lower() not in PERIOD_TYPES:
+            return invalid_period_type_error(period_type)
+
+        # Missing parameters are filled in from today's financial periods by mcp_utils
         return await (await utils()).get_calendar_period_date_range(financial_year, period_number, period_type)
     
-    except Exception as e:
-        return json.dumps({"error": str(e)})
+    except RuntimeError as e:
+        return error_json(str(e))
+
+
+@mcp.tool(output_schema=None)
+async def batch_get(
+    requests: Annotated[List[BatchItem], Field(min_length=1)]
+) -> str:
+    """
+    Run several fast lookups in one call; they are executed concurrently.
+    Use this instead of calling get_rows_fast, get_top_n_fast, get_financial_periods or
+    get_calendar_period_date_range several times in a row.
+
+    Args:
+        requests: List of {"op": ..., "args": {...}} where op is one of
+            - "rows": args as for get_rows_fast (subject, select, where, limit, offset)
+            - "top_n": args as for get_top_n_fast (subject, group_by, order_by, n, where, limit, offset)
+            - "periods": args as for get_financial_periods (target_date)
+            - "period_range": args as for get_calendar_period_date_range (financial_year, period_number, period_type)
+
+    Example:
+        batch_get(requests=[
+            {"op": "periods", "args": {}},
+            {"op": "top_n", "args": {"subject": "Sales", "group_by": "Region", "order_by": "Sales Value", "n": 5}}
+        ])
 
+    Returns:
+        JSON list with the result of each request, in the order given
+    """
+    try:
+        return await (await utils()).batch_get(requests)
+    except RuntimeError as e:
+        return error_json(str(e))
 
 async def _rag_tenant_resolver() -> str:
     # Must match LangChainMCPChat's `_external_id(tenant, app_name)` byte-for-byte
@@ -476,9 +705,33 @@ agentic_rag_tool.register(
     tenant_resolver=_rag_tenant_resolver if INMYDATA_USE_OAUTH else None,
 )
 
+if not INMYDATA_USE_OAUTH:
+    # Create the app after tools are registered. Built at import time so that uvicorn
+    # worker processes, which import this module by name, can find it.
+    app = mcp.http_app()
+
+
+_log = logging.getLogger("inmydata")
+
+# Startup banner, joined once rather than printed line by line
+if INMYDATA_USE_OAUTH:
+    _BANNER_TRANSPORT = "OAuth and streamable-http transport"
+    _BANNER = "Connectors should use OAuth to authenticate via the /mcp endpoint."
+else:
+    _BANNER_TRANSPORT = "streamable-http transport"
+    _BANNER = "\n".join([
+        "Credentials should be passed via headers:",
+        "  Authorization: Your API key, prefixed with 'Bearer '",
+        "  x-inmydata-tenant: Your tenant name",
+        "  x-inmydata-server: Server name (optional, default: inmydata.com)",
+        "  x-inmydata-calendar: Your calendar name",
+        "  x-inmydata-user: User for events (optional, default: mcp-agent)",
+        "  x-inmydata-session-id: Session ID (optional, default: mcp-session)",
+    ])
+
 
 if __name__ == "__main__":
-    import sys
+    import importlib.util
     import uvicorn
 
     port = 8000
@@ -489,21 +742,32 @@ if __name__ == "__main__":
         if len(sys.argv) > 2:
             port = int(sys.argv[2])
     
-    if INMYDATA_USE_OAUTH:
-        print(f"Starting MCP server with OAuth and streamable-http transport on port {port}")
-        print("Connectors should use OAuth to authenticate via the /mcp endpoint.")
+    # Set INMYDATA_LOG_LEVEL=WARNING in production to skip the banner entirely. Only the
+    # "inmydata" logger is configured; library loggers keep their own levels.
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(handler)
+    log_level = os.environ.get('INMYDATA_LOG_LEVEL', 'INFO').upper()
+    _log.propagate = False
+    if log_level in logging.getLevelNamesMapping():
+        _log.setLevel(log_level)
     else:
-        # Create the app after tools are registered
-        app = mcp.streamable_http_app()
-        print(f"Starting MCP server with streamable-http transport on port {port}")
-        print("Credentials should be passed via headers:")
-        print("  Authorization: Your API key, prefixed with 'Bearer '")
-        print("  x-inmydata-tenant: Your tenant name")
-        print("  x-inmydata-server: Server name (optional, default: inmydata.com)")
-        print("  x-inmydata-calendar: Your calendar name")
-        print("  x-inmydata-user: User for events (optional, default: mcp-agent)")
-        print("  x-inmydata-session-id: Session ID (optional, default: mcp-session)")
+        # A typo shouldn't stop the server from starting
+        _log.setLevel(logging.INFO)
+        _log.warning("Unknown INMYDATA_LOG_LEVEL %r; using INFO", log_level)
+    _log.info("Starting MCP server with %s on port %d\n%s", _BANNER_TRANSPORT, port, _BANNER)
     
-    uvicorn.run(app, host="0.0.0.0", port=port, ws="none")
+    # Prefer the uvloop event loop and httptools parser when installed (see the "perf" extra);
+    # both are C implementations and noticeably cut per-request overhead for small tool calls.
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+    # Each worker is a separate process with its own caches. uvicorn can only spawn
+    # workers from an import string, so the app object is passed directly for a single worker.
+    # WEB_CONCURRENCY is the worker count most hosting platforms set for uvicorn/gunicorn apps
+    workers = int(os.environ.get('INMYDATA_WORKERS') or os.environ.get('WEB_CONCURRENCY') or '1')
+    target = "server_remote:app" if workers > 1 else app
+
+    uvicorn.run(target, host="0.0.0.0", port=port, workers=workers, ws="none", loop=loop, http=http, log_level="warning", access_log=False)
 
 